@@ -1,22 +1,204 @@
 #from csv import QUOTE_STRINGS
 import os 
+import sys
 import logging
-from datetime import datetime, timedelta 
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
 import polars as pl 
+import pyarrow as pa
+import requests
 from alpaca_trade_api.rest import REST 
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from ciso8601 import parse_datetime
+except ImportError:
+    if sys.version_info >= (3, 11):
+        # fromisoformat handles a trailing 'Z' natively from 3.11
+        parse_datetime = datetime.fromisoformat
+    else:
+        def parse_datetime(value):
+            """Parse an ISO 8601 timestamp, accepting a trailing 'Z'"""
+
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class AlpacaClient:
-    """Client for interacting with Alpaca API"""
+# Maximum number of symbols Alpaca accepts in a single multi-symbol data request
+MAX_SYMBOLS_PER_REQUEST = 200
 
-    def __init__(self, api_key=None, api_secret=None, base_url=None):
-        """Initialize Alpaca client"""
+# Number of get_bars_arrow results, and their total Arrow bytes, kept in the
+# in-memory LRU cache; a single result larger than the byte cap is never cached
+BARS_CACHE_SIZE = 256
+BARS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Windows must have ended at least this long ago to be cached; recent bars
+# are still being finalised and SIP data is delayed on the free plan
+BARS_CACHE_MIN_AGE = timedelta(minutes=15)
+
+# Bar columns and the raw v2 bar field each one is loaded from
+BAR_FIELDS = {
+    "symbol": "S",
+    "timestamp": "t",
+    "open": "o",
+    "high": "h",
+    "low": "l",
+    "close": "c",
+    "volume": "v",
+    "trade_count": "n",
+    "vwap": "vw"
+}
+
+# Fixed Arrow schema for bar tables, so no types are ever inferred
+BAR_SCHEMA = pa.schema([
+    ("symbol", pa.string()),
+    ("timestamp", pa.timestamp("ns", tz="UTC")),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+    ("trade_count", pa.int64()),
+    ("vwap", pa.float64())
+])
+
+# Alpaca allows 200 requests per minute per account, counted separately
+# for the trading and market data APIs
+RATE_LIMIT_PER_SECOND = 200 / 60
+RATE_LIMIT_BURST = 20
 
+# Timezone the Alpaca trading calendar's open/close times are given in
+MARKET_TZ = ZoneInfo("America/New_York")
 
+# Seconds that get_assets / get_calendar results stay fresh in memory
+REFERENCE_CACHE_TTL = 300
+
+
+_ENV_LOADED = False
+
+
+def _ensure_env():
+    """Load the .env file into the environment once per process"""
+
+    global _ENV_LOADED
+    if not _ENV_LOADED:
         load_dotenv()
+        _ENV_LOADED = True
+
+
+_ensure_env()
+
+
+def format_rfc3339(dt):
+    """Format a datetime as RFC3339 without microseconds, avoiding strftime"""
+
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}T{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}Z"
+
+
+def chunked(items, size=MAX_SYMBOLS_PER_REQUEST):
+    """Split a sequence into consecutive chunks of at most `size` items"""
+
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _orjson_response_hook(response, *args, **kwargs):
+    """Make response.json() decode with orjson instead of the stdlib json module"""
+
+    response.json = lambda **_: orjson.loads(response.content)
+    return response
+
+
+class TokenBucket:
+    """Thread-safe token bucket that paces callers to a sustained request rate"""
+
+    def __init__(self, rate, burst):
+        """Initialize a full bucket refilling at `rate` tokens per second"""
+
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until it is available"""
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now; a negative balance is how long this caller waits
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Shared by every client in the process, since the limits are per account.
+# Separate buckets keep account, calendar and order calls from queueing
+# behind a large data scan.
+_default_data_rate_limiter = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+_default_trading_rate_limiter = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+
+
+class RateLimitedSession(requests.Session):
+    """requests.Session that takes a rate-limit token before every HTTP request"""
+
+    def __init__(self, data_rate_limiter, trading_rate_limiter):
+        """Initialize the session with the data and trading API limiters"""
+
+        super().__init__()
+        self.data_rate_limiter = data_rate_limiter
+        self.trading_rate_limiter = trading_rate_limiter
+
+    def request(self, method, url, *args, **kwargs):
+        """Wait for a token from the endpoint's limiter, then send the request"""
+
+        if (urlsplit(url).hostname or "").startswith("data."):
+            self.data_rate_limiter.acquire()
+        else:
+            self.trading_rate_limiter.acquire()
+        return super().request(method, url, *args, **kwargs)
+
+
+def _build_session(data_rate_limiter, trading_rate_limiter, pool_connections=32, pool_maxsize=64):
+    """Build a pooled, rate-limited keep-alive HTTP session for the REST client"""
+
+    session = RateLimitedSession(data_rate_limiter, trading_rate_limiter)
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        # urllib3 retries connection errors inside the adapter, so they don't
+        # go back through RateLimitedSession.request and take no token
+        max_retries=Retry(total=3, backoff_factor=0.2)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip"})
+    if orjson is not None:
+        session.hooks["response"].append(_orjson_response_hook)
+    return session
+
+
+class AlpacaClient:
+    """Client for interacting with Alpaca API"""
+
+    def __init__(self, api_key=None, api_secret=None, base_url=None, data_rate_limiter=None, trading_rate_limiter=None):
+        """Initialize Alpaca client"""
 
         self.api_key = api_key or os.environ.get("ALPACA_API_KEY")
         self.api_secret = api_secret or os.environ.get("ALPACA_API_SECRET")
@@ -26,8 +208,36 @@ class AlpacaClient:
             raise ValueError("Alpaca API Credentials messing")
 
         self.api = REST(self.api_key, self.api_secret, self.base_url)
+        # Reuse sockets across calls and threads instead of re-handshaking
+        self.api._session = _build_session(
+            data_rate_limiter or _default_data_rate_limiter,
+            trading_rate_limiter or _default_trading_rate_limiter
+        )
+
+        # LRU cache of bar tables keyed by (symbols, timeframe, start, end, limit, columns)
+        self._bars_cache = OrderedDict()
+        self._bars_cache_bytes = 0
+        # TTL caches of (fetched_at, value) for slow-changing reference data
+        self._assets_cache = {}
+        self._calendar_cache = {}
+        # (trading date, (open, close) or None) for is_market_open
+        self._today_session = None
+        self._cache_lock = threading.Lock()
         logger.info("Alpaca client initialized with base URL: %s", self.base_url) 
 
+    def _get_cached(self, cache, key, fetch, ttl=REFERENCE_CACHE_TTL):
+        """Return a cached value younger than `ttl` seconds, refetching otherwise"""
+
+        with self._cache_lock:
+            cached = cache.get(key)
+            if cached is not None and time.monotonic() - cached[0] < ttl:
+                return cached[1]
+
+        value = fetch()
+
+        with self._cache_lock:
+            cache[key] = (time.monotonic(), value)
+        return value
 
     def get_account(self):
         """Retrieve account information"""
@@ -48,41 +258,100 @@ class AlpacaClient:
             logger.error("Error fetching account information: %s", str(e))
             raise
 
-    def get_bars(self, symbols, timeframe="1Min", start=None, end=None, limit=None):
+    def get_bars(self, symbols, timeframe="1Min", start=None, end=None, limit=None, cache=True):
         """Fetch historical bar data for given symbols and timeframe"""
 
+        return pl.from_arrow(
+            self.get_bars_arrow(symbols, timeframe, start, end, limit, cache=cache),
+            rechunk=False
+        )
+
+    def get_bars_arrow(self, symbols, timeframe="1Min", start=None, end=None, limit=None, schema=BAR_SCHEMA, cache=True):
+        """Fetch historical bar data as an Arrow table with a fixed schema
+
+        Pass cache=False for one-off reads such as backfill windows, which are
+        never requested again and would otherwise sit in the LRU.
+        """
+
         try:
+            # A defaulted end means "now", which is never stable enough to cache
+            cacheable = cache and end is not None
+
         # Default to last 24 hours if not specified
             if start is None:
                 start = (datetime.now() - timedelta(days=1))
             elif isinstance(start, str):
-                start = datetime.fromisoformat(start.replace('Z', '+00:00'))
+                start = parse_datetime(start)
             
             if end is None:
                 end = datetime.now()
             elif isinstance(end, str):
-                end = datetime.fromisoformat(end.replace('Z', '+00:00'))
+                end = parse_datetime(end)
         
         # Format timestamps in RFC3339 format without microseconds
-            start_str = start.strftime('%Y-%m-%dT%H:%M:%SZ')
-            end_str = end.strftime('%Y-%m-%dT%H:%M:%SZ')
+            start_str = format_rfc3339(start)
+            end_str = format_rfc3339(end)
             
+            key = (
+                (symbols,) if isinstance(symbols, str) else tuple(symbols),
+                timeframe,
+                start_str,
+                end_str,
+                limit,
+                tuple(schema.names)
+            )
+            # Decide before fetching, so a slow fetch can't age the window into the cache
+            cacheable = cacheable and end_str <= format_rfc3339(datetime.now(timezone.utc) - BARS_CACHE_MIN_AGE)
+
+            if cacheable:
+                with self._cache_lock:
+                    if key in self._bars_cache:
+                        self._bars_cache.move_to_end(key)
+                        return self._bars_cache[key]
+
             logger.info(f"Fetching {timeframe} bars for {symbols} from {start_str} to {end_str}")
         
-        # Get bars data
-            bars = self.api.get_bars(
-                symbols,
+        # Get raw bars data and load only the schema's columns, skipping the pandas .df
+            columns = {name: [] for name in schema.names}
+            fields = [(BAR_FIELDS[name], columns[name]) for name in schema.names]
+            raw_bars = self.api.get_bars_iter(
+                list(key[0]),
                 timeframe,
                 start=start_str,
                 end=end_str,
-                limit=limit
-            ).df
+                limit=limit,
+                raw=True
+            )
+            for bar in raw_bars:
+                for field, values in fields:
+                    values.append(bar.get(field))
+
+            # Timestamps arrive as RFC3339 strings; Arrow parses them in one cast
+            result = pa.Table.from_arrays(
+                [
+                    pa.array(columns[f.name], type=pa.string()).cast(f.type)
+                    if pa.types.is_timestamp(f.type)
+                    else pa.array(columns[f.name], type=f.type)
+                    for f in schema
+                ],
+                schema=schema
+            )
 
-            if bars.empty:
+            if result.num_rows == 0:
                 logger.warning(f"No data returned for {symbols} from {start} to {end}")
-                return pl.DataFrame()
 
-            return bars 
+            if cacheable and result.nbytes <= BARS_CACHE_MAX_BYTES:
+                with self._cache_lock:
+                    if key in self._bars_cache:
+                        self._bars_cache_bytes -= self._bars_cache.pop(key).nbytes
+                    self._bars_cache[key] = result
+                    self._bars_cache_bytes += result.nbytes
+
+                    while len(self._bars_cache) > BARS_CACHE_SIZE or self._bars_cache_bytes > BARS_CACHE_MAX_BYTES:
+                        _, evicted = self._bars_cache.popitem(last=False)
+                        self._bars_cache_bytes -= evicted.nbytes
+
+            return result
 
         except Exception as e:
             logger.error(f"Error fetching bar data: {str(e)}")
@@ -94,45 +363,94 @@ class AlpacaClient:
         try:
             quotes = {}
 
-            for symbol in symbols:
-                quote = self.api.get_latest_quote(symbol)
-                quotes[symbol] = {
-                    "bid_price": float(quote.bp),
-                    "bid_size": int(quote.bs),
-                    "ask_price": float(quote.ap),
-                    "ask_size": int(quote.as_),
-                    "timestamp": quote.t
-                }
-                
+            # One request per chunk of symbols instead of one per symbol
+            for chunk in chunked(symbols):
+                raw = self.api.get_latest_quotes(chunk)
+                # QuoteV2 exposes mapped field names; symbols with no quote map to None
+                quotes.update({
+                    symbol: {
+                        "bid_price": float(quote.bid_price),
+                        "bid_size": int(quote.bid_size),
+                        "ask_price": float(quote.ask_price),
+                        "ask_size": int(quote.ask_size),
+                        "timestamp": quote.timestamp
+                    }
+                    for symbol, quote in raw.items()
+                    if quote is not None
+                })
+
             return quotes 
         except Exception as e:
             logger.error(f"Error fetching quotes: {str(e)}")
             raise 
 
+    def _get_today_session(self):
+        """Get today's (open, close) datetimes, or None if the market is closed all day"""
+
+        today = datetime.now(MARKET_TZ).date()
+
+        if self._today_session is None or self._today_session[0] != today:
+            calendar = self.get_calendar(start=today.isoformat(), end=today.isoformat())
+
+            session = None
+            if calendar.height > 0:
+                day = calendar.row(0, named=True)
+                session = (
+                    datetime.fromisoformat(f"{day['date']}T{day['open']}").replace(tzinfo=MARKET_TZ),
+                    datetime.fromisoformat(f"{day['date']}T{day['close']}").replace(tzinfo=MARKET_TZ)
+                )
+
+            self._today_session = (today, session)
+
+        return self._today_session[1]
+
     def is_market_open(self):
         """Checks if market is currently open"""
 
         try:
-            clock = self.api.get_clock()
-            return clock.is_open
+            # Compare against today's cached session instead of calling the clock API
+            session = self._get_today_session()
+            if session is None:
+                return False
+
+            open_ts, close_ts = session
+            return open_ts <= datetime.now(MARKET_TZ) < close_ts
         except Exception as e:
             logger.error(f"Error checking market status: {str(e)}")
             raise       
 
     def get_assets(self, status="active", asset_class="us_equity"):
-        """Get a list of assets"""
+        """Get a DataFrame of assets"""
         try:
-            assets = self.api.list_assets(status=status, asset_class=asset_class)
-            return [
-                {
-                    "id": asset.id,
-                    "symbol": asset.symbol,
-                    "name": asset.name,
-                    "exchange": asset.exchange,
-                    "tradable": asset.tradable
-                }
-                for asset in assets
-            ]
+            def fetch():
+                assets = self.api.list_assets(status=status, asset_class=asset_class)
+
+                ids, symbols, names, exchanges, tradables = [], [], [], [], []
+                for asset in assets:
+                    ids.append(asset.id)
+                    symbols.append(asset.symbol)
+                    names.append(asset.name)
+                    exchanges.append(asset.exchange)
+                    tradables.append(asset.tradable)
+
+                return pl.DataFrame(
+                    {
+                        "id": ids,
+                        "symbol": symbols,
+                        "name": names,
+                        "exchange": exchanges,
+                        "tradable": tradables
+                    },
+                    schema={
+                        "id": pl.Utf8,
+                        "symbol": pl.Utf8,
+                        "name": pl.Utf8,
+                        "exchange": pl.Utf8,
+                        "tradable": pl.Boolean
+                    }
+                )
+
+            return self._get_cached(self._assets_cache, (status, asset_class), fetch)
         except Exception as e:
             logger.error(f"Error fetching assets: {str(e)}")
             raise
@@ -146,15 +464,26 @@ class AlpacaClient:
             if end is None:
                 end = datetime.now().date().isoformat()
             
-            calendar = self.api.get_calendar(start=start, end=end)
-            return [
-                {
-                    "date": day.date.isoformat(), 
-                    "open": day.open.isoformat(),
-                    "close": day.close.isoformat()
-                }
-                for day in calendar
-            ]
+            def fetch():
+                calendar = self.api.get_calendar(start=start, end=end)
+
+                dates, opens, closes = [], [], []
+                for day in calendar:
+                    dates.append(day.date)
+                    opens.append(day.open)
+                    closes.append(day.close)
+
+                # Keep the raw date/time objects and format whole columns at once
+                return pl.DataFrame(
+                    {"date": dates, "open": opens, "close": closes},
+                    schema={"date": pl.Datetime("us"), "open": pl.Time, "close": pl.Time}
+                ).with_columns([
+                    pl.col("date").dt.strftime("%Y-%m-%d"),
+                    pl.col("open").dt.strftime("%H:%M:%S"),
+                    pl.col("close").dt.strftime("%H:%M:%S")
+                ])
+
+            return self._get_cached(self._calendar_cache, (start, end), fetch)
         except Exception as e:
             logger.error(f"Error fetching calendar: {str(e)}")
             raise  
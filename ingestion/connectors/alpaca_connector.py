@@ -1,23 +1,156 @@
 import os
+import asyncio
 import logging
-from datetime import datetime, timedelta 
-import polars as pd 
-from dotenv import load_dotenv
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import polars as pl 
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-from alpaca.client import AlpacaClient
+from alpaca.client import BAR_SCHEMA, MARKET_TZ, AlpacaClient, chunked, parse_datetime
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Number of concurrent symbol-screening requests in get_tradable_symbols
+SCREEN_MAX_WORKERS = 32
+
+# The screen averages the most recent complete daily bars. Fourteen calendar
+# days hold at least 5 sessions even across the Christmas / New Year holidays,
+# and each 200-symbol chunk still fits in one page.
+SCREEN_TIMEFRAME = "1Day"
+SCREEN_LOOKBACK_DAYS = 14
+SCREEN_BARS = 5
+
+# Attempts per screening chunk before its symbols are reported as failed,
+# and the seconds to wait before each retry (multiplied by the attempt number)
+SCREEN_CHUNK_ATTEMPTS = 2
+SCREEN_RETRY_BACKOFF = 1.0
+
+# Number of backfill windows fetched concurrently
+BACKFILL_MAX_CONCURRENCY = 8
+
+# Bar columns fetch_bars requires and keeps
+REQUIRED_COLUMNS = ['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+# Minute-bar columns narrowed to Float32 / Int32. close stays Float64 so
+# high-priced symbols keep their cents; coarser bars keep every column at
+# full width because their volumes can exceed 2^31
+NARROW_PRICE_COLUMNS = ('open', 'high', 'low')
+
+# The only bar columns the tradable-symbol screen needs
+SCREEN_BAR_SCHEMA = pa.schema([
+    ('symbol', pa.string()),
+    ('close', pa.float64()),
+    ('volume', pa.int64())
+])
+
+# Streamed bars are handed to the callback in batches of this size,
+# or after this many seconds, whichever comes first
+STREAM_FLUSH_SIZE = 64
+STREAM_FLUSH_INTERVAL = 1.0
+
+# Per-bar columns buffered from the stream; timeframe and source are constant
+STREAM_BAR_SCHEMA = {
+    'symbol': pl.Utf8,
+    'timestamp': pl.Datetime('ns', 'UTC'),
+    'open': pl.Float32,
+    'high': pl.Float32,
+    'low': pl.Float32,
+    'close': pl.Float64,
+    'volume': pl.Int32,
+    'fetched_at': pl.Datetime('us')
+}
+
+# Column order of streamed frames, matching fetch_bars output
+STREAM_COLUMNS = ['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume', 'timeframe', 'source', 'fetched_at']
+
+class BarBuffer:
+    """Buffer streamed bars and pass them to a callback in micro-batches"""
+
+    def __init__(self, callback, flush_size=STREAM_FLUSH_SIZE, flush_interval=STREAM_FLUSH_INTERVAL):
+        """Initialize an empty buffer for the given callback"""
+
+        self.callback = callback
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._cols = {name: [] for name in STREAM_BAR_SCHEMA}
+        self._last_flush = time.monotonic()
+        self._flusher = None
+
+    def append(self, bar):
+        """Add a bar, flushing once the batch is full or old enough"""
+
+        # Start the timer on the stream's event loop with the first bar
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+        cols = self._cols
+        cols['symbol'].append(bar.symbol)
+        cols['timestamp'].append(bar.timestamp)
+        cols['open'].append(bar.open)
+        cols['high'].append(bar.high)
+        cols['low'].append(bar.low)
+        cols['close'].append(bar.close)
+        cols['volume'].append(bar.volume)
+        cols['fetched_at'].append(datetime.now())
+
+        if len(cols['symbol']) >= self.flush_size or time.monotonic() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Pass all buffered bars to the callback as one DataFrame"""
+
+        self._last_flush = time.monotonic()
+
+        if not self._cols['symbol']:
+            return
+
+        df = pl.DataFrame(self._cols, schema=STREAM_BAR_SCHEMA).with_columns([
+            pl.lit('1Min').alias('timeframe'),
+            pl.lit('alpaca_stream').alias('source')
+        ]).select(STREAM_COLUMNS)
+        self._cols = {name: [] for name in STREAM_BAR_SCHEMA}
+
+        self.callback(df)
+
+    def close(self):
+        """Stop the flush timer and pass any remaining bars to the callback"""
+
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        self._flusher = None
+
+        self.flush()
+
+    async def _flush_periodically(self):
+        """Force a flush on quiet streams so bars never wait past the interval"""
+
+        while True:
+            # Sleep only until the next flush is due, not a whole interval
+            remaining = self._last_flush + self.flush_interval - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+                continue
+
+            # A failing callback must not kill the timer, or quiet streams stop flushing
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in stream callback: {str(e)}")
+
 class AlpacaConnector:
     """Connector for fetching market data from Alpaca API"""
 
     def __init__(self, api_key=None, api_secret=None, base_url=None):
         """Initialize the Alpaca connector"""
 
-        load_dotenv()
-
         self.client = AlpacaClient(api_key, api_secret, base_url)
+        # BarBuffer of the most recent setup_streaming call
+        self.stream_buffer = None
         logger.info("Alpaca connector initialized")
 
     def check_market_status(self):
@@ -25,82 +158,166 @@ class AlpacaConnector:
 
         return self.client.is_market_open()
 
-    def fetch_bars(self, symbols, timeframe="1Min", start=None, end=None, limit=None):
+    def fetch_bars(self, symbols, timeframe="1Min", start=None, end=None, limit=None, cache=True):
         """Fetch historical bar data for the given symbols"""
 
         try:
-            bars = self.client.get_bars(symbols, timeframe, start, end, limit)
+            bars = self.client.get_bars(symbols, timeframe, start, end, limit, cache=cache)
 
-            if bars.empty:
+            if bars.height == 0:
                 logger.warning(f"No data returned for {symbols}")
-                return pd.DataFrame()
-
-            bars = bars.reset_index()
+                return pl.DataFrame()
 
-            required_columns = ['symbol','timestamp','open','high','low','close']
-            for col in required_columns:
-                if col not in bars.column:
+            for col in REQUIRED_COLUMNS:
+                if col not in bars.columns:
                     logger.error(f"Missing required column: {col}")
-                    return pd.DataFrame()
-
-            formatted_bars = bars[required_columns].copy()
-
-            formatted_bars['timeframe'] = timeframe
-            formatted_bars['source'] = 'alpaca'
-            formatted_bars['fetched_at'] = datetime.now()
+                    return pl.DataFrame()
 
-            return formatted_bars
+            return self._format_bars(bars, timeframe)
         
         except Exception as e:
             logger.error(f"Error fetching bar data: {str(e)}")
             raise
 
-    def backfill(self, symbols, timeframe="1Min", start_date=None, end_date=None, batch_size=1000):
-        """Backfill historical data for the given symbols"""
+    def _format_bars(self, bars, timeframe):
+        """Select, narrow and annotate raw bars into the connector's output schema"""
+
+        formatted_bars = bars.lazy().select(REQUIRED_COLUMNS)
+
+        if timeframe.endswith('Min'):
+            formatted_bars = formatted_bars.with_columns(
+                [pl.col(c).cast(pl.Float32) for c in NARROW_PRICE_COLUMNS]
+                + [pl.col('volume').cast(pl.Int32)]
+            )
+
+        return (
+            formatted_bars
+            .with_columns([
+                pl.lit(timeframe).alias('timeframe'),
+                pl.lit('alpaca').alias('source'),
+                pl.lit(datetime.now()).alias('fetched_at')
+            ])
+            .collect()
+        )
+
+    def _write_windows(self, symbols, timeframe, windows, batch_size, max_concurrency, output_path):
+        """Fetch backfill windows concurrently and append them to Parquet in window order"""
+
+        writer = None
+        rows = 0
+        # Keep at most max_concurrency windows in flight or awaiting their write
+        pending = deque()
+
+        def write_oldest():
+            nonlocal writer, rows
+            start_datetime, end_datetime, future = pending.popleft()
+            batch_data = future.result()
+
+            if batch_data.height == 0:
+                return
+
+            table = batch_data.to_arrow()
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema, compression="zstd")
+            writer.write_table(table)
+
+            rows += batch_data.height
+            logger.info(f"Fetched {batch_data.height} rows for {start_datetime.date()} to {end_datetime.date()}")
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                for start_datetime, end_datetime in windows:
+                    logger.info(f"Fetching batch from {start_datetime} to {end_datetime}")
+
+                    future = executor.submit(
+                        self.fetch_bars,
+                        symbols,
+                        timeframe,
+                        start=start_datetime,
+                        end=end_datetime,
+                        limit=batch_size,
+                        # Windows never overlap, so caching them would only pin memory
+                        cache=False
+                    )
+                    pending.append((start_datetime, end_datetime, future))
+
+                    if len(pending) >= max_concurrency:
+                        write_oldest()
+
+                while pending:
+                    write_oldest()
+        finally:
+            if writer is not None:
+                writer.close()
+
+        return rows
+
+    def backfill(self, symbols, timeframe="1Min", start_date=None, end_date=None, batch_size=1000, max_concurrency=BACKFILL_MAX_CONCURRENCY, output_path=None):
+        """Backfill historical data for the given symbols into a Parquet file
+
+        Returns a lazy scan of the file, so the caller owns it and must keep it in
+        place while the scan is in use; deleting or reusing the path also changes
+        what the LazyFrame reads. When output_path is None a new file is created
+        in the temp directory for every call.
+        """
 
         try:
             if start_date is None:
                 start_date = (datetime.now() - timedelta(days=30)).date()
             elif isinstance(start_date, str):
-                start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00')).date()
+                start_date = parse_datetime(start_date).date()
 
             if end_date is None:
-                end_date = datetime.now().date():
+                end_date = datetime.now().date()
             elif isinstance(end_date, str):
-                end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00')).date()
+                end_date = parse_datetime(end_date).date()
 
             logger.info(f"backfilling {timeframe} data for {symbols} from {start_date} to {end_date}")
 
+            # Precompute the weekly windows so they can be fetched concurrently
+            windows = []
             current_date = start_date
-            all_data = []
 
             while current_date <= end_date:
                 batch_end = min(current_date + timedelta(days=7), end_date)
 
-                start_datetime = datetime.combine(current_date, datetime.min.time())
-                end_datetime = datetime.combine(batch_end, datetime.max.time())
+                windows.append((
+                    datetime.combine(current_date, datetime.min.time()),
+                    datetime.combine(batch_end, datetime.max.time())
+                ))
 
-                logger.info(f"Fetching batch from {start_datetime} to {end_datetime}")
+                current_date = batch_end + timedelta(days=1)
 
-                batch_data = self.fetch_bars(
-                    symbols,
-                    timeframe,
-                    start=start_datetime,
-                    end=end_datetime,
-                    limit=batch_size
+            if output_path is None:
+                # A fresh file per call, so earlier LazyFrames never see later data
+                fd, output_path = tempfile.mkstemp(prefix="backfill-", suffix=".parquet")
+                tmp_path = output_path
+            else:
+                # Write beside the output and rename on success, so a failed backfill
+                # never leaves a partial output and concurrent backfills don't collide
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(os.path.abspath(output_path)),
+                    suffix=".parquet.tmp"
                 )
+            os.close(fd)
 
-                if not batch_data.empty:
-                    all_data.append(batch_data)
-                    logger.info(f"Fetched {len(batch_data)} rows for {current_date} to {batch_end}")
+            try:
+                rows = self._write_windows(symbols, timeframe, windows, batch_size, max_concurrency, tmp_path)
 
-                current_date = batch_end + timedelta(days=1)
+                if not rows:
+                    logger.warning("No data returned from backfill")
+                    # Still write the file, so the output on disk always matches the result
+                    empty = self._format_bars(pl.from_arrow(BAR_SCHEMA.empty_table()), timeframe)
+                    pq.write_table(empty.to_arrow(), tmp_path, compression="zstd")
 
-            if all_data:
-                return pd.concat(all_data, ignore_index=True)
-            else:
-                logger.warning("No data returned from backfill")
-                return pd.DataFrame()
+                if tmp_path != output_path:
+                    os.replace(tmp_path, output_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            return pl.scan_parquet(output_path)
         except Exception as e:
             logger.error(f"Error during backfill: {str(e)}")
             raise 
@@ -120,26 +337,25 @@ class AlpacaConnector:
             else:
                 stream = Stream(api_key, api_secret, base_url='https://api.alpaca.markets', data_feed='iex')
 
+            buffer = BarBuffer(callback)
+            self.stream_buffer = buffer
+
             async def on_minute_bars(bar):
-                bar_dict = {
-                    'symbol':bar.symbol,
-                    'timestamp':pd.Timestamp(bar.timestamp),
-                    'open': bar.open,
-                    'high': bar.high,
-                    'low': bar.low,
-                    'close': bar.close,
-                    'volume': bar.volume,
-                    'timeframe': '1Min',
-                    'source': 'alpaca_stream',
-                    'fetched_at': datetime.now()
-                }
-
-                df = pd.DataFrame([bar_dict])
-
-                callback(df)
-
-            for symbol in symbols:
-                stream.subscribe_bars(on_minute_bars, symbol)
+                buffer.append(bar)
+
+            # One subscribe frame for all symbols rather than one per symbol
+            stream.subscribe_bars(on_minute_bars, *symbols)
+
+            # Deliver the final partial batch once the stream stops
+            run = stream.run
+
+            def run_and_flush():
+                try:
+                    run()
+                finally:
+                    buffer.close()
+
+            stream.run = run_and_flush
             
             logger.info(f"Stream setup complete for {symbols}")
             return stream
@@ -148,36 +364,61 @@ class AlpacaConnector:
             logger.error(f"Error setting up streaming: {str(e)}")
             raise 
 
-    def get_tradable_symbols(self, status="active", asset_class="us_equity", min_price=5.0, min_volume=500000):
+    def _check_symbols(self, symbols, min_price, min_volume):
+        """Screen a chunk of symbols with a single multi-symbol bars request"""
+
+        # End at the start of today's New York trading day so today's partial bar
+        # never counts towards the averages
+        end = datetime.now(MARKET_TZ).replace(hour=0, minute=0, second=0, microsecond=0).astimezone(timezone.utc)
+        start = end - timedelta(days=SCREEN_LOOKBACK_DAYS)
+
+        for attempt in range(1, SCREEN_CHUNK_ATTEMPTS + 1):
+            try:
+                bars = pl.from_arrow(
+                    self.client.get_bars_arrow(symbols, SCREEN_TIMEFRAME, start=start, end=end, schema=SCREEN_BAR_SCHEMA),
+                    rechunk=False
+                )
+                break
+            except Exception as e:
+                if attempt == SCREEN_CHUNK_ATTEMPTS:
+                    logger.error(
+                        f"Error checking {len(symbols)} symbols {symbols[0]}..{symbols[-1]} "
+                        f"after {attempt} attempts, treating them as untradable: {str(e)}"
+                    )
+                    return [(symbol, False) for symbol in symbols]
+                logger.warning(f"Retrying symbols {symbols[0]}..{symbols[-1]} after error: {str(e)}")
+                time.sleep(SCREEN_RETRY_BACKOFF * attempt)
+
+        if bars.height == 0:
+            return [(symbol, False) for symbol in symbols]
+
+        # Average close and daily volume over each symbol's latest sessions
+        stats = bars.group_by('symbol').agg([
+            pl.col('close').tail(SCREEN_BARS).mean(),
+            pl.col('volume').tail(SCREEN_BARS).mean()
+        ])
+        passing = set(
+            stats.filter((pl.col('close') >= min_price) & (pl.col('volume') >= min_volume))['symbol']
+        )
+
+        return [(symbol, symbol in passing) for symbol in symbols]
+
+    def get_tradable_symbols(self, status="active", asset_class="us_equity", min_price=5.0, min_volume=500000, max_workers=SCREEN_MAX_WORKERS):
         """Get a list of tradable symbols based on criteria"""
 
         try:
             assets = self.client.get_assets(status=status, asset_class=asset_class)
 
-            tradable_symbols = []
+            candidate_symbols = assets.filter(
+                pl.col('tradable') & pl.col('symbol').str.contains(r'^[A-Za-z0-9]+$')
+            )['symbol'].to_list()
 
-            for asset in asset:
-                if not asset.get('tradable', False):
-                    continue
-                symbol = asset.get('symbol')
-
-                if not symbol.isalnum():
-                    continue
-                    
-                try:
-                    bars = self.client.get_bars([symbol], limit=5)
-
-                    if bars.empty:
-                        continue
-
-                    avg_close = bars['close'].mean()
-                    avg_volume = bars['volume'].mean()
-
-                    if avg_close >= min_price and avg_volume >= min_volume:
-                        tradable_symbols.append(symbol)
-                except Exception as e:
-                    logger.warning(f"Error checking {symbol}: {str(e)}")
-                    continue
+            with ThreadPoolExecutor(max_workers=max_workers) as ex:
+                results = ex.map(
+                    lambda chunk: self._check_symbols(chunk, min_price, min_volume),
+                    chunked(candidate_symbols)
+                )
+                tradable_symbols = [s for chunk in results for s, ok in chunk if ok]
             
             logger.info(f"Found {len(tradable_symbols)} tradable symbols")
             return tradable_symbols
@@ -202,4 +443,4 @@ if __name__ == "__main__":
     # Test backfill
     start_date = (datetime.now() - timedelta(days=5)).date().isoformat()
     backfill_data = connector.backfill(["AAPL"], start_date=start_date)
-    print(f"Backfill rows: {len(backfill_data)}")
\ No newline at end of file
+    print(f"Backfill rows: {backfill_data.select(pl.len()).collect().item()}")
\ No newline at end of file